@@ -1,8 +1,53 @@
 import streamlit as st
-import os
-import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from rag_chain import RAGAssistant
-from utils import save_uploaded_file, display_source_documents, init_session_state
+from config import GROQ_API_KEY, LOG_LEVEL, MAX_VISIBLE_MESSAGES
+from utils import (
+    save_uploaded_file, display_source_documents, display_chat_message,
+    get_cached_stats, init_session_state, no_gc, throttle_stream
+)
+
+# No-op on reruns: basicConfig only configures the root logger once
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# Static page content, built once at import rather than on every rerun
+_SECURITY_BADGE_HTML = """
+<div style="background-color: #e8f5e8; padding: 10px; border-radius: 5px; border-left: 4px solid #4CAF50;">
+    <strong>🔒 Security Enabled:</strong> This assistant only uses your uploaded documents and follows strict ethical guidelines.
+</div>
+<br>
+"""
+
+_SECURITY_INFO_MARKDOWN = """
+**Privacy & Security Features:**
+- Documents are processed locally on your device
+- Only document content is sent to the AI service
+- No personal data is stored or shared
+- All analysis is based solely on your uploaded content
+- API keys are handled securely
+"""
+
+_ABOUT_MARKDOWN = """
+**Ethical AI Framework:**
+- **Privacy First**: Only processes explicitly uploaded documents
+- **Transparency**: Clearly indicates source-based responses
+- **Safety**: Implements content boundaries and ethical guidelines
+- **Accuracy**: Qualifies information based on source reliability
+
+**This assistant will:**
+✓ Only use your uploaded documents for responses
+✓ Provide source attribution when possible
+✓ Decline to answer questions outside document scope
+✓ Follow ethical AI guidelines and safety protocols
+
+**This assistant will not:**
+✗ Access external information or previous conversations
+✗ Provide medical, legal, or financial advice
+✗ Generate harmful or misleading content
+✗ Store or share personal identifiable information
+"""
 
 # Page configuration
 st.set_page_config(
@@ -14,23 +59,24 @@ st.set_page_config(
 # Initialize session state
 init_session_state()
 
-# Check if API key is available in environment
-env_api_key_available = bool(os.getenv("GROQ_API_KEY"))
+# Look up the assistant and its readiness once per run
+rag = st.session_state.rag_assistant
+initialized = rag.is_initialized()
+has_docs = initialized and rag.has_documents()
+
+# Check if API key is available in environment (read once by config at import)
+env_api_key_available = bool(GROQ_API_KEY)
 
 # Sidebar for document upload and API key setup
-with st.sidebar:
+@st.fragment
+def render_sidebar():
+    """Sidebar body; widget interactions here rerun only this fragment"""
     st.title("📁 Document Management")
     
     # Security and privacy notice
     with st.expander("🔒 Security Information"):
-        st.info("""
-        **Privacy & Security Features:**
-        - Documents are processed locally on your device
-        - Only document content is sent to the AI service
-        - No personal data is stored or shared
-        - All analysis is based solely on your uploaded content
-        - API keys are handled securely
-        """)
+        st.info(_SECURITY_INFO_MARKDOWN)
+
     
     # Only show API key input if not available in environment
     if not env_api_key_available:
@@ -46,15 +92,14 @@ with st.sidebar:
                 st.session_state.api_key = api_key.strip()
                 
                 # Update the RAG assistant with the new API key
-                success = st.session_state.rag_assistant.update_api_key(api_key)
+                success = rag.update_api_key(api_key)
                 st.session_state.api_key_set = success
                 
                 if success:
-                    st.success("API key set successfully! Assistant initialized.")
-                    time.sleep(1)
+                    st.toast("API key set successfully! Assistant initialized.", icon="✅")
                     st.rerun()
                 else:
-                    error_msg = st.session_state.rag_assistant.get_initialization_error()
+                    error_msg = rag.get_initialization_error()
                     st.error(f"Failed to set API key: {error_msg}")
             else:
                 st.error("Please enter a valid API key")
@@ -83,28 +128,43 @@ with st.sidebar:
     )
     
     if uploaded_files and st.button("Process Documents", key="process_docs"):
-        if not st.session_state.rag_assistant.is_initialized():
+        if not initialized:
             if env_api_key_available:
                 st.error("Assistant initialization failed. Please check your .env file API key.")
             else:
                 st.error("Please set your Groq API key first!")
         else:
             with st.spinner("Processing documents securely..."):
-                file_paths = []
+                new_files = []
+                new_hashes = []
                 for uploaded_file in uploaded_files:
-                    # Skip if already processed
-                    if uploaded_file.name in st.session_state.processed_files:
+                    # Skip if the same content was already processed, even under another name
+                    content_hash = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+                    if content_hash in st.session_state.processed_hashes:
                         st.info(f"Already processed: {uploaded_file.name}")
                         continue
-                        
-                    file_path = save_uploaded_file(uploaded_file)
-                    file_paths.append(file_path)
-                    st.session_state.processed_files.add(uploaded_file.name)
+                    
+                    new_files.append(uploaded_file)
+                    new_hashes.append(content_hash)
+                
+                file_paths = []
+                if new_files:
+                    # Write uploads to disk concurrently
+                    with ThreadPoolExecutor(max_workers=min(8, len(new_files))) as executor:
+                        file_paths = list(executor.map(save_uploaded_file, new_files, new_hashes))
                 
                 if file_paths:
                     try:
-                        num_docs = st.session_state.rag_assistant.add_documents(file_paths)
+                        # The upload hashes double as the stored content_hash, so files are not re-read
+                        num_docs = rag.add_documents(file_paths, new_hashes)
                         if num_docs > 0:
+                            # Only marked processed once ingested, so a failed upload can be retried
+                            st.session_state.processed_hashes.update(new_hashes)
+                            st.session_state.kb_version += 1
+                            if not has_docs:
+                                # The main area gates the chat on having documents, so rerun the whole app
+                                st.toast(f"Processed {num_docs} document chunks! You can now ask questions about these documents.", icon="✅")
+                                st.rerun()
                             st.success(f"Processed {num_docs} document chunks! You can now ask questions about these documents.")
                         else:
                             st.warning("No new content was extracted from the documents.")
@@ -117,8 +177,8 @@ with st.sidebar:
     st.divider()
     st.subheader("Document Status")
     
-    if st.session_state.rag_assistant.is_initialized():
-        stats = st.session_state.rag_assistant.get_stats()
+    if initialized:
+        stats = get_cached_stats(rag, st.session_state.kb_version)
         doc_count = stats.get("collection_count", 0)
         
         if doc_count > 0:
@@ -139,7 +199,7 @@ with st.sidebar:
         st.rerun()
     
     # Ethical guidelines
-    st.sidebar.markdown("---")
+    st.markdown("---")
     with st.expander("📋 Ethical Guidelines"):
         st.markdown("""
         **AI Assistant Ethical Framework:**
@@ -151,20 +211,18 @@ with st.sidebar:
         - Provides source attribution
         """)
 
+with st.sidebar:
+    render_sidebar()
+
 # Main content area
 st.title("🔒 MarketMuse - Secure Document Analysis")
 st.caption("Ask questions about your uploaded documents with built-in safety protocols")
 
 # Security badge
-st.markdown("""
-<div style="background-color: #e8f5e8; padding: 10px; border-radius: 5px; border-left: 4px solid #4CAF50;">
-    <strong>🔒 Security Enabled:</strong> This assistant only uses your uploaded documents and follows strict ethical guidelines.
-</div>
-<br>
-""", unsafe_allow_html=True)
+st.html(_SECURITY_BADGE_HTML)
 
 # Display status message
-if not st.session_state.rag_assistant.is_initialized():
+if not initialized:
     if env_api_key_available:
         st.error("""
         **Assistant initialization failed.**
@@ -175,7 +233,7 @@ if not st.session_state.rag_assistant.is_initialized():
         3. The Groq API service is available
         """)
         
-        error_msg = st.session_state.rag_assistant.get_initialization_error()
+        error_msg = rag.get_initialization_error()
         st.warning(f"**Error details:** {error_msg}")
     else:
         st.error("""
@@ -187,7 +245,7 @@ if not st.session_state.rag_assistant.is_initialized():
         3. Click the 'Set API Key' button
         """)
 
-elif not st.session_state.rag_assistant.has_documents():
+elif not has_docs:
     st.warning("""
     **No documents uploaded.**
     
@@ -202,113 +260,70 @@ elif not st.session_state.rag_assistant.has_documents():
 else:
     st.success("✅ Assistant is ready! You can ask questions about your uploaded documents.")
 
-# Display chat messages
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# Chat history and input; a new question reruns only this fragment
+@st.fragment
+def render_chat():
+    """Chat history and input"""
+    # Display chat messages - only the most recent ones unless the user asks for more
+    hidden_messages = st.session_state.messages[:-MAX_VISIBLE_MESSAGES]
+    show_earlier = bool(hidden_messages) and st.toggle(f"Show earlier messages ({len(hidden_messages)})", key="show_earlier")
+    with no_gc():
+        if show_earlier:
+            for message in hidden_messages:
+                display_chat_message(message)
         
-        if message.get("sources"):
-            with st.expander("📄 View Source Documents"):
-                for source in message["sources"]:
-                    st.text(f"Document: {source.metadata.get('source', 'Unknown')}")
-                    if 'page' in source.metadata:
-                        st.text(f"Page: {source.metadata.get('page', 'N/A')}")
-                    st.caption(source.page_content[:200] + "...")
+        for message in st.session_state.messages[-MAX_VISIBLE_MESSAGES:]:
+            display_chat_message(message)
 
-# Chat input (only show if initialized and has documents)
-if (st.session_state.rag_assistant.is_initialized() and 
-    st.session_state.rag_assistant.has_documents()):
+    # Chat input (only show if initialized and has documents)
+    if has_docs:
     
-    if prompt := st.chat_input("Ask a question about your documents..."):
-        # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        if prompt := st.chat_input("Ask a question about your documents..."):
+            # Add user message to chat history
+            st.session_state.messages.append({"role": "user", "content": prompt})
         
-        # Display user message
-        with st.chat_message("user"):
-            st.markdown(prompt)
+            # Display user message
+            with st.chat_message("user"):
+                st.markdown(prompt)
         
-        # Generate assistant response
-        with st.chat_message("assistant"):
-            with st.spinner("Analyzing your documents securely..."):
-                try:
-                    response = st.session_state.rag_assistant.query(prompt)
+            # Generate assistant response
+            with st.chat_message("assistant"):
+                with st.spinner("Analyzing your documents securely..."):
+                    try:
+                        response = rag.stream_query(prompt)
                     
-                    # Display response
-                    st.markdown(response["result"])
+                        # Display response as it is generated
+                        with no_gc():
+                            answer = st.write_stream(throttle_stream(response["result"]))
                     
-                    # Display sources if available
-                    if response.get("source_documents"):
-                        display_source_documents(response["source_documents"])
+                        # Display sources if available
+                        if response.get("source_documents"):
+                            display_source_documents(response["source_documents"])
                     
-                    # Add to message history
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": response["result"],
-                        "sources": response.get("source_documents", [])
-                    })
-                except Exception as e:
-                    error_msg = f"Error generating response: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": error_msg
-                    })
-elif st.session_state.rag_assistant.is_initialized():
-    # Show message about needing documents
-    disabled_chat = st.chat_input("Upload documents in the sidebar to ask questions...", disabled=True)
-else:
-    # Show disabled chat input
-    disabled_chat = st.chat_input("Set your API key to enable chat...", disabled=True)
+                        # Add to message history
+                        st.session_state.messages.append({
+                            "role": "assistant", 
+                            "content": answer,
+                            "sources": response.get("source_documents", [])
+                        })
+                    except Exception as e:
+                        error_msg = f"Error generating response: {str(e)}"
+                        st.error(error_msg)
+                        st.session_state.messages.append({
+                            "role": "assistant", 
+                            "content": error_msg
+                        })
+    elif initialized:
+        # Show message about needing documents
+        disabled_chat = st.chat_input("Upload documents in the sidebar to ask questions...", disabled=True)
+    else:
+        # Show disabled chat input
+        disabled_chat = st.chat_input("Set your API key to enable chat...", disabled=True)
+
+render_chat()
 
 # Footer with ethical guidelines
 st.markdown("---")
 with st.expander("ℹ️ About This Assistant"):
-    st.markdown("""
-    **Ethical AI Framework:**
-    - **Privacy First**: Only processes explicitly uploaded documents
-    - **Transparency**: Clearly indicates source-based responses
-    - **Safety**: Implements content boundaries and ethical guidelines
-    - **Accuracy**: Qualifies information based on source reliability
-    
-    **This assistant will:**
-    ✓ Only use your uploaded documents for responses
-    ✓ Provide source attribution when possible
-    ✓ Decline to answer questions outside document scope
-    ✓ Follow ethical AI guidelines and safety protocols
-    
-    **This assistant will not:**
-    ✗ Access external information or previous conversations
-    ✗ Provide medical, legal, or financial advice
-    ✗ Generate harmful or misleading content
-    ✗ Store or share personal identifiable information
-    """)
+    st.markdown(_ABOUT_MARKDOWN)
 
-    # Add to your existing app.py
-
-# In the sidebar, add a button to clear conversation memory:
-if st.button("Clear Conversation Memory", key="clear_memory"):
-    st.session_state.rag_assistant.clear_memory()
-    st.session_state.messages = []
-    st.success("Conversation memory cleared!")
-    time.sleep(1)
-    st.rerun()
-
-# In the query method, use the conversational approach:
-def query(self, question: str):
-    """Query the RAG system with conversation memory"""
-    if not self.is_initialized():
-        return {"result": "RAG assistant not initialized.", "source_documents": []}
-    
-    # Security check first
-    if self._is_security_threat(question):
-        return {"result": "I'm designed to help analyze uploaded documents. I cannot answer questions about my internal functioning.", "source_documents": []}
-    
-    try:
-        # Use conversational QA chain with memory
-        result = self.qa_chain({"question": question})
-        return {
-            "result": result.get("answer", "No answer generated"),
-            "source_documents": result.get("source_documents", [])
-        }
-    except Exception as e:
-        return {"result": f"Error: {str(e)}", "source_documents": []}
\ No newline at end of file
@@ -0,0 +1,136 @@
+import os
+import logging
+import pickle
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+class QuestionCache:
+    """Values keyed by normalized question text with TTL and LRU eviction"""
+    def __init__(self, ttl: float = 300, capacity: int = 256):
+        self.ttl = ttl
+        self.capacity = capacity
+        self._entries = OrderedDict()  # normalized question -> (value, created_at)
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(question: str) -> str:
+        return " ".join(question.lower().split()).rstrip("?!. ")
+    
+    def get(self, question: str):
+        """Return the cached value for the same question, or None"""
+        key = self._normalize(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+    
+    def put(self, question: str, value):
+        """Store a value under the given question"""
+        key = self._normalize(question)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Get hit/miss statistics"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0
+            }
+
+class CachedEmbedder(Embeddings):
+    """Embeddings wrapper that memoizes query embeddings in a precomputed table plus an LRU"""
+    def __init__(self, base: Embeddings, capacity: int = 1000, cache_path: str = None):
+        self.base = base
+        self.capacity = capacity
+        self.cache_path = cache_path
+        self._precomputed = {}
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_path:
+            self.load()
+    
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents with the underlying model (not cached)"""
+        return self.base.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, reusing a cached vector when the same text was seen before"""
+        key = self._key(text)
+        with self._lock:
+            vector = self._precomputed.get(key)
+            if vector is None:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+        if vector is not None:
+            return vector
+        
+        vector = self.base.embed_query(text)
+        with self._lock:
+            self._lru[key] = vector
+            while len(self._lru) > self.capacity:
+                self._lru.popitem(last=False)
+        return vector
+    
+    def warmup(self, queries: List[str]):
+        """Precompute embeddings for queries that are expected to be asked often"""
+        for query in queries:
+            key = self._key(query)
+            if key not in self._precomputed:
+                self._precomputed[key] = self.base.embed_query(query)
+    
+    def load(self):
+        """Load previously saved query embeddings from cache_path"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "rb") as f:
+                saved = pickle.load(f)
+            with self._lock:
+                self._precomputed.update(saved.get("precomputed", {}))
+                self._lru.update(saved.get("lru", {}))
+        except Exception as e:
+            logger.warning("Error loading query embedding cache: %s", e)
+    
+    def save(self):
+        """Save cached query embeddings to cache_path so they survive restarts"""
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            with self._lock:
+                saved = {"precomputed": dict(self._precomputed), "lru": dict(self._lru)}
+            with open(self.cache_path, "wb") as f:
+                pickle.dump(saved, f)
+        except Exception as e:
+            logger.warning("Error saving query embedding cache: %s", e)
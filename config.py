@@ -1,24 +1,82 @@
 import os
+import functools
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # API Configuration - with better fallback handling
+@functools.lru_cache(maxsize=1)
 def get_api_key():
     """Get API key from environment or return empty string"""
     return os.getenv("GROQ_API_KEY", "").strip()
 
 GROQ_API_KEY = get_api_key()
 GROQ_MODEL = "llama-3.1-8b-instant"
+# Seconds a successful API key check is trusted before the key is re-validated
+API_KEY_VALIDATION_TTL = 300
+# Also send a test prompt through the LLM client at startup (costs one Groq call)
+VALIDATE_LLM_ON_INIT = os.getenv("VALIDATE_LLM_ON_INIT", "").strip().lower() in ("1", "true", "yes")
+
+# Answer cache: reuse an answer only for the same question (case/whitespace-insensitive).
+# Embedding similarity is not used here: questions differing in one entity or number
+# ("Q3 budget" vs "Q4 budget") score as near-identical but need different answers.
+ANSWER_CACHE_TTL = 300
+ANSWER_CACHE_SIZE = 256
 
 # Vector Store Configuration
 VECTOR_STORE_PATH = "chroma_db"
 COLLECTION_NAME = "marketmuse_documents"
+# Flush the HNSW index to disk in large batches instead of on every add
+CHROMA_COLLECTION_METADATA = {"hnsw:sync_threshold": 10000, "hnsw:batch_size": 1000}
+
+# Retrieval Configuration - MMR drops near-duplicate chunks from the prompt context
+RETRIEVER_SEARCH_TYPE = "mmr"
+RETRIEVER_SEARCH_KWARGS = {"k": 4, "fetch_k": 20, "lambda_mult": 0.5}
+# Optional cosine-similarity floor for retrieved chunks (None disables it). Questions with no
+# chunk above it are answered "cannot answer" without an LLM call. Broad questions
+# ("summarize the key points") score low against any single chunk, so calibrate this on real
+# queries for the embedding model in use before enabling it.
+RETRIEVAL_SCORE_THRESHOLD = os.getenv("RETRIEVAL_SCORE_THRESHOLD", "").strip()
+RETRIEVAL_SCORE_THRESHOLD = float(RETRIEVAL_SCORE_THRESHOLD) if RETRIEVAL_SCORE_THRESHOLD else None
+# Retrieved chunks are reused for the same question until new documents are added
+RETRIEVAL_CACHE_TTL = 3600
+RETRIEVAL_CACHE_SIZE = 1024
 
 # Document Processing Configuration
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+SOURCE_PREVIEW_CHARS = 200
+# Number of non-PDF documents loaded and split concurrently during ingest (PDFs go one at a time)
+LOAD_DOCUMENTS_WORKERS = int(os.getenv("LOAD_DOCUMENTS_NUMBER_OF_THREADS", max(1, (os.cpu_count() or 2) - 1)))
+# Chunks embedded and written per batch, and split batches allowed to wait for the embedder
+INGEST_BATCH_SIZE = 256
+INGEST_QUEUE_SIZE = 2
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 128
+# Device for the embedding model ("cuda", "cpu", "mps"); unset lets sentence-transformers pick
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "").strip() or None
+# Where model weights are downloaded to; unset uses the sentence-transformers default
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "").strip() or None
+# "torch" (default) or "onnx" to run the int8-quantized ONNX export on CPU.
+# ONNX needs `pip install sentence-transformers[onnx]`; vectors differ slightly
+# from the torch model, so clear and re-ingest documents after switching.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+EMBEDDING_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+# Query embedding cache, saved across restarts (one file per model and backend, so
+# vectors from another model are never loaded)
+QUERY_EMBEDDING_CACHE_SIZE = 1000
+QUERY_EMBEDDING_CACHE_PATH = os.path.join(
+    ".cache", f"query_embeddings_{EMBEDDING_MODEL.replace('/', '--')}_{EMBEDDING_BACKEND}.pkl"
+)
+# Frequently asked questions to embed at startup
+WARMUP_QUERIES = []
 
 # Supported File Types
-SUPPORTED_EXTENSIONS = ['.pdf', '.txt', '.docx', '.pptx', '.html', '.md']
\ No newline at end of file
+SUPPORTED_EXTENSIONS = frozenset({'.pdf', '.txt', '.docx', '.pptx', '.html', '.md'})
+
+# Logging level for the app's modules; errors are logged at WARNING, tracebacks at ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").strip().upper()
+
+# UI Configuration
+MAX_VISIBLE_MESSAGES = 20
\ No newline at end of file
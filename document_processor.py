@@ -1,13 +1,69 @@
 import os
+import logging
+import atexit
+import hashlib
+import functools
+import importlib
+import itertools
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-from langchain_community.document_loaders import (
-    PyPDFLoader, TextLoader, UnstructuredWordDocumentLoader,
-    UnstructuredPowerPointLoader, UnstructuredHTMLLoader
-)
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings  
-from config import CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL, SUPPORTED_EXTENSIONS
+from cache import CachedEmbedder
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_DEVICE,
+    EMBEDDING_CACHE_DIR, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE, INGEST_BATCH_SIZE, LOAD_DOCUMENTS_WORKERS, QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_PATH,
+    SOURCE_PREVIEW_CHARS, SUPPORTED_EXTENSIONS
+)
+
+logger = logging.getLogger(__name__)
+
+@functools.lru_cache(maxsize=None)
+def get_embeddings(model_name: str = EMBEDDING_MODEL):
+    """Load the embedding model once per process and share it across sessions"""
+    model_kwargs = {"device": EMBEDDING_DEVICE} if EMBEDDING_DEVICE else {}
+    if EMBEDDING_BACKEND == "onnx":
+        # Dynamic int8 weights; ONNX Runtime uses VNNI dot products where the CPU has them
+        model_kwargs["backend"] = "onnx"
+        model_kwargs["model_kwargs"] = {"file_name": EMBEDDING_ONNX_FILE}
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        cache_folder=EMBEDDING_CACHE_DIR,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE, "normalize_embeddings": True}
+    )
+
+# Loader class per extension, imported on first use so a text-only ingest never loads pdfium/unstructured
+LOADER_CLASSES = {
+    '.pdf': 'PyPDFium2Loader',
+    '.txt': 'TextLoader',
+    '.docx': 'UnstructuredWordDocumentLoader',
+    '.doc': 'UnstructuredWordDocumentLoader',
+    '.pptx': 'UnstructuredPowerPointLoader',
+    '.ppt': 'UnstructuredPowerPointLoader',
+    '.html': 'UnstructuredHTMLLoader',
+    '.htm': 'UnstructuredHTMLLoader',
+}
+
+@functools.lru_cache(maxsize=None)
+def get_loader_class(ext: str):
+    """Import and return the document loader class for a file extension"""
+    if ext not in LOADER_CLASSES:
+        raise ValueError(f"Unsupported file type: {ext}")
+    document_loaders = importlib.import_module("langchain_community.document_loaders")
+    return getattr(document_loaders, LOADER_CLASSES[ext])
+
+@functools.lru_cache(maxsize=1)
+def get_query_cached_embeddings():
+    """Embedding model wrapped with the persistent query cache, saved once at exit"""
+    embeddings = CachedEmbedder(
+        get_embeddings(EMBEDDING_MODEL),
+        capacity=QUERY_EMBEDDING_CACHE_SIZE,
+        cache_path=QUERY_EMBEDDING_CACHE_PATH
+    )
+    atexit.register(embeddings.save)
+    return embeddings
 
 class DocumentProcessor:
     def __init__(self):
@@ -16,59 +72,148 @@ class DocumentProcessor:
             chunk_overlap=CHUNK_OVERLAP,
             length_function=len,
         )
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        self.embeddings = get_query_cached_embeddings()
+    
+    @staticmethod
+    def _file_hash(file_path: str) -> str:
+        """128-bit BLAKE2b of a file's contents, read in 1 MiB blocks (same digest as the upload check)"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
     
     def load_document(self, file_path: str):
         """Load document based on file extension"""
         ext = os.path.splitext(file_path)[1].lower()
         
         try:
-            if ext == '.pdf':
-                loader = PyPDFLoader(file_path)
-            elif ext == '.txt':
-                loader = TextLoader(file_path, encoding='utf-8')
-            elif ext in ['.docx', '.doc']:
-                loader = UnstructuredWordDocumentLoader(file_path)
-            elif ext in ['.pptx', '.ppt']:
-                loader = UnstructuredPowerPointLoader(file_path)
-            elif ext in ['.html', '.htm']:
-                loader = UnstructuredHTMLLoader(file_path)
+            loader_cls = get_loader_class(ext)
+            if ext == '.txt':
+                loader = loader_cls(file_path, encoding='utf-8')
             else:
-                raise ValueError(f"Unsupported file type: {ext}")
+                loader = loader_cls(file_path)
             
             return loader.load()
         except Exception as e:
-            print(f"Error loading document {file_path}: {str(e)}")
+            logger.warning("Error loading document %s: %s", file_path, e)
             return []
     
+    def process_single(self, file_path: str, content_hash: str = None):
+        """Load a single document and split it into chunks"""
+        print(f"Processing: {file_path}")
+        try:
+            docs = self.load_document(file_path)
+            if docs:
+                chunks = self.text_splitter.split_documents(docs)
+                # Add source metadata and a display preview to each chunk
+                for chunk in chunks:
+                    metadata = chunk.metadata
+                    metadata.setdefault('source', file_path)
+                    metadata['preview'] = chunk.page_content[:SOURCE_PREVIEW_CHARS] + "..."
+                    if content_hash:
+                        metadata['content_hash'] = content_hash
+                print(f"Added {len(chunks)} chunks from {file_path}")
+                return chunks
+            else:
+                print(f"No content extracted from {file_path}")
+        except Exception as e:
+            logger.warning("Error processing %s: %s", file_path, e)
+        
+        return []
+    
     def process_documents(self, file_paths: List[str]):
         """Process multiple documents and split into chunks"""
-        all_docs = []
+        return self._process_files(file_paths, verified=False)
+    
+    def process_directory(self, dir_path: str):
+        """Process every supported file directly inside a directory"""
+        # scandir returns file type and name with the listing, so no extra stat per file
+        with os.scandir(dir_path) as entries:
+            file_paths = [
+                entry.path for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS
+            ]
+        return self._process_files(sorted(file_paths), verified=True)
+    
+    def _process_files(self, file_paths: List[str], verified: bool):
+        """Load and split files; verified=True means existence and type were already checked"""
+        return list(itertools.chain.from_iterable(self.iter_chunk_batches(file_paths, verified=verified)))
+    
+    def _select_new_files(self, file_paths: List[str], verified: bool, is_ingested=None, content_hashes=None):
+        """Return (paths, content hashes) of files that are valid and not yet ingested
         
-        for file_path in file_paths:
-            if not os.path.exists(file_path):
-                print(f"File not found: {file_path}")
-                continue
+        is_ingested(content_hash) reports whether the vector store already holds that file.
+        content_hashes, if given, holds each file's precomputed _file_hash.
+        """
+        valid_paths = []
+        new_hashes = []
+        seen_hashes = set()
+        for file_path, content_hash in zip(file_paths, content_hashes or itertools.repeat(None)):
+            if not verified:
+                if not os.path.exists(file_path):
+                    print(f"File not found: {file_path}")
+                    continue
+                
+                ext = os.path.splitext(file_path)[1].lower()
+                if ext not in SUPPORTED_EXTENSIONS:
+                    print(f"Skipping unsupported file type: {file_path}")
+                    continue
             
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext not in SUPPORTED_EXTENSIONS:
-                print(f"Skipping unsupported file type: {file_path}")
+            # Skip files whose exact content is already in the vector store
+            if content_hash is None:
+                content_hash = self._file_hash(file_path)
+            if content_hash in seen_hashes or (is_ingested is not None and is_ingested(content_hash)):
+                print(f"Skipping already ingested file: {file_path}")
                 continue
-                
-            print(f"Processing: {file_path}")
-            try:
-                docs = self.load_document(file_path)
-                if docs:
-                    chunks = self.text_splitter.split_documents(docs)
-                    # Add source metadata to each chunk
-                    for chunk in chunks:
-                        if 'source' not in chunk.metadata:
-                            chunk.metadata['source'] = file_path
-                    all_docs.extend(chunks)
-                    print(f"Added {len(chunks)} chunks from {file_path}")
-                else:
-                    print(f"No content extracted from {file_path}")
-            except Exception as e:
-                print(f"Error processing {file_path}: {str(e)}")
+            
+            valid_paths.append(file_path)
+            new_hashes.append(content_hash)
+            seen_hashes.add(content_hash)
+        return valid_paths, new_hashes
+    
+    def iter_chunk_batches(self, file_paths: List[str], batch_size: int = INGEST_BATCH_SIZE,
+                           verified: bool = False, is_ingested=None, content_hashes=None):
+        """Yield chunks of new files in batches of batch_size as soon as their files are split"""
+        valid_paths, content_hashes = self._select_new_files(file_paths, verified, is_ingested, content_hashes)
+        if not valid_paths:
+            return
+        
+        # PDFium is not thread-safe (langchain serializes it behind a lock, and older
+        # pypdfium2 builds can crash), so PDFs are split one at a time in this thread
+        # while the pool handles the other formats alongside them
+        pdf_files = []
+        other_files = []
+        for file_path, content_hash in zip(valid_paths, content_hashes):
+            if os.path.splitext(file_path)[1].lower() == '.pdf':
+                pdf_files.append((file_path, content_hash))
+            else:
+                other_files.append((file_path, content_hash))
         
-        return all_docs
\ No newline at end of file
+        workers = max(1, min(LOAD_DOCUMENTS_WORKERS, len(other_files)))
+        batch = []
+        skipped = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.process_single, *item) for item in other_files]
+            results = itertools.chain(
+                (self.process_single(*item) for item in pdf_files),
+                (future.result() for future in futures)
+            )
+            for chunks in results:
+                # Boilerplate repeated verbatim across pages of a file is embedded only once;
+                # other files keep their copy so answers can still cite them
+                seen = set()
+                for chunk in chunks:
+                    key = hashlib.blake2b(" ".join(chunk.page_content.split()).encode("utf-8"), digest_size=16).digest()
+                    if key in seen:
+                        skipped += 1
+                    else:
+                        seen.add(key)
+                        batch.append(chunk)
+                while len(batch) >= batch_size:
+                    yield batch[:batch_size]
+                    batch = batch[batch_size:]
+        if batch:
+            yield batch
+        if skipped:
+            print(f"Skipped {skipped} duplicate chunks")
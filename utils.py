@@ -1,19 +1,72 @@
+import gc
 import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
 import streamlit as st
 from typing import List
 from rag_chain import RAGAssistant
+from vector_store import VectorStoreManager
+from config import SOURCE_PREVIEW_CHARS
 
-def save_uploaded_file(uploaded_file, save_dir: str = "data") -> str:
+def save_uploaded_file(uploaded_file, content_hash: str, save_dir: str = "data") -> str:
     """Save uploaded file to directory and return path"""
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
+    # One subdirectory per content hash, so different uploads sharing a file name
+    # never overwrite each other (or the source files of already-ingested chunks)
+    save_dir = os.path.join(save_dir, content_hash)
+    os.makedirs(save_dir, exist_ok=True)
     
     file_path = os.path.join(save_dir, uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    # Stream in 1 MiB blocks instead of materializing the whole upload, into a
+    # temp file that is renamed into place so no reader ever sees a partial file
+    uploaded_file.seek(0)
+    fd, tmp_path = tempfile.mkstemp(dir=save_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(uploaded_file, f, length=1 << 20)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
     
     return file_path
 
+@contextmanager
+def no_gc():
+    """Pause cyclic garbage collection for a short render-heavy block"""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+            gc.collect(generation=0)
+
+def throttle_stream(chunks, min_interval: float = 0.05):
+    """Coalesce streamed text chunks so the UI re-renders at most every min_interval seconds"""
+    buffer = []
+    last_flush = time.monotonic()
+    for chunk in chunks:
+        buffer.append(chunk)
+        now = time.monotonic()
+        if now - last_flush >= min_interval:
+            yield "".join(buffer)
+            buffer.clear()
+            last_flush = now
+    
+    if buffer:
+        yield "".join(buffer)
+
+def source_preview(doc) -> str:
+    """Short preview of a source chunk, precomputed at ingest when available"""
+    preview = doc.metadata.get("preview")
+    if preview is None:
+        # Chunks ingested before previews were stored
+        preview = doc.page_content[:SOURCE_PREVIEW_CHARS] + "..."
+    return preview
+
 def display_source_documents(source_docs):
     """Display source documents in a user-friendly format"""
     if not source_docs:
@@ -25,23 +78,53 @@ def display_source_documents(source_docs):
             st.text(f"Source: {doc.metadata.get('source', 'Unknown')}")
             if 'page' in doc.metadata:
                 st.text(f"Page: {doc.metadata.get('page', 'N/A')}")
-            st.text(f"Content: {doc.page_content[:200]}...")
+            st.text(f"Content: {source_preview(doc)}")
             st.divider()
 
+def display_chat_message(message):
+    """Render a single chat history entry with its source documents"""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        
+        if message.get("sources"):
+            with st.expander("📄 View Source Documents"):
+                for source in message["sources"]:
+                    st.text(f"Document: {source.metadata.get('source', 'Unknown')}")
+                    if 'page' in source.metadata:
+                        st.text(f"Page: {source.metadata.get('page', 'N/A')}")
+                    st.caption(source_preview(source))
+
+@st.cache_data(ttl=5)
+def _cached_stats(_assistant, assistant_id: int, kb_version: int):
+    """Cached knowledge base stats; the leading underscore keeps Streamlit from hashing the assistant"""
+    return _assistant.get_stats()
+
+def get_cached_stats(assistant, kb_version: int):
+    """Get knowledge base stats, refreshed every few seconds or when kb_version changes"""
+    return _cached_stats(assistant, id(assistant), kb_version)
+
+@st.cache_resource
+def _get_vector_store_manager():
+    """Load the embedding model and Chroma client once per process and share them across sessions"""
+    return VectorStoreManager()
+
 def init_session_state():
     """Initialize session state variables"""
     if "rag_assistant" not in st.session_state:
-        # Initialize without API key first
-        st.session_state.rag_assistant = RAGAssistant()
+        # One assistant (API key, LLM client, chain) per session over the shared knowledge base
+        st.session_state.rag_assistant = RAGAssistant(vector_store_manager=_get_vector_store_manager())
     
     if "messages" not in st.session_state:
         st.session_state.messages = []
     
-    if "processed_files" not in st.session_state:
-        st.session_state.processed_files = set()
+    if "processed_hashes" not in st.session_state:
+        st.session_state.processed_hashes = set()
+    
+    if "kb_version" not in st.session_state:
+        st.session_state.kb_version = 0
     
     if "api_key" not in st.session_state:
-        st.session_state.api_key = os.getenv("GROQ_API_KEY", "")
+        st.session_state.api_key = ""
     
     if "api_key_set" not in st.session_state:
         st.session_state.api_key_set = False
\ No newline at end of file
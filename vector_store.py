@@ -1,95 +1,217 @@
 import os
-from typing import List, Optional
+import logging
+import uuid
+import queue
+import threading
+from typing import Any, List, Optional
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+from chromadb.utils.batch_utils import create_batches
 from langchain_community.vectorstores import Chroma
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
 from document_processor import DocumentProcessor
-from config import VECTOR_STORE_PATH, COLLECTION_NAME
+from cache import QuestionCache
+from config import (
+    VECTOR_STORE_PATH, COLLECTION_NAME, CHROMA_COLLECTION_METADATA,
+    INGEST_BATCH_SIZE, INGEST_QUEUE_SIZE, RETRIEVER_SEARCH_TYPE, RETRIEVER_SEARCH_KWARGS,
+    RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_SIZE, RETRIEVAL_SCORE_THRESHOLD
+)
+
+logger = logging.getLogger(__name__)
+
+class CachedRetriever(BaseRetriever):
+    """Retriever that answers through VectorStoreManager.retrieve and its retrieval cache"""
+    manager: Any
+    
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.manager.retrieve(query)
 
 class VectorStoreManager:
     def __init__(self):
         self.processor = DocumentProcessor()
         self.vector_store = None
+        self._client = None
+        # Chunk count of the collection, kept up to date by add/clear so stats need no RPC
+        self._count_cache = None
+        # Bumped whenever chunks are added or the store is cleared, so sessions can drop stale answers
+        self.generation = 0
+        # normalized question text -> retrieved chunks; exact text only, since embedding
+        # similarity treats "Q3 budget" and "Q4 budget" as the same question
+        self.retrieval_cache = QuestionCache(ttl=RETRIEVAL_CACHE_TTL, capacity=RETRIEVAL_CACHE_SIZE)
+    
+    def _get_client(self):
+        """Get the persistent Chroma client, creating it on first use"""
+        if self._client is None:
+            self._client = chromadb.PersistentClient(
+                path=VECTOR_STORE_PATH,
+                settings=Settings(anonymized_telemetry=False)
+            )
+        return self._client
     
     def initialize_vector_store(self, documents: Optional[List[Document]] = None):
         """Initialize or load the vector store"""
+        self._count_cache = None
         try:
-            # Check if vector store already exists
-            if os.path.exists(VECTOR_STORE_PATH) and os.listdir(VECTOR_STORE_PATH):
-                try:
-                    # Load existing vector store
-                    self.vector_store = Chroma(
-                        persist_directory=VECTOR_STORE_PATH,
-                        embedding_function=self.processor.embeddings,
-                        collection_name=COLLECTION_NAME
-                    )
-                    print("Loaded existing vector store")
-                    return self.vector_store
-                except Exception as e:
-                    print(f"Error loading existing vector store: {e}")
-                    # Fall through to create new one
-            
-            # Create new vector store if documents are provided
-            if documents and len(documents) > 0:
-                try:
-                    self.vector_store = Chroma.from_documents(
-                        documents=documents,
-                        embedding=self.processor.embeddings,
-                        persist_directory=VECTOR_STORE_PATH,
-                        collection_name=COLLECTION_NAME
-                    )
-                    self.vector_store.persist()
-                    print(f"Created new vector store with {len(documents)} documents")
-                    return self.vector_store
-                except Exception as e:
-                    print(f"Error creating new vector store: {e}")
-                    return None
-            
-            # No existing store and no documents provided
-            print("No existing vector store found and no documents provided")
-            # Create an empty vector store for initialization
-            try:
-                from langchain_community.vectorstores import Chroma
-                self.vector_store = Chroma(
-                    embedding_function=self.processor.embeddings,
-                    persist_directory=VECTOR_STORE_PATH,
-                    collection_name=COLLECTION_NAME
-                )
-                print("Created empty vector store for initialization")
-                return self.vector_store
-            except Exception as e:
-                print(f"Error creating empty vector store: {e}")
-                return None
-            
+            # The persistent client opens the collection if it exists and creates it otherwise
+            self.vector_store = Chroma(
+                client=self._get_client(),
+                persist_directory=VECTOR_STORE_PATH,
+                embedding_function=self.processor.embeddings,
+                collection_name=COLLECTION_NAME,
+                collection_metadata=CHROMA_COLLECTION_METADATA
+            )
+            if documents:
+                self.vector_store.add_documents(documents, ids=[str(uuid.uuid4()) for _ in documents])
+                print(f"Added {len(documents)} documents to the vector store")
+            print("Vector store ready")
+            return self.vector_store
         except Exception as e:
-            print(f"Error initializing vector store: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error initializing vector store: %s", e)
             self.vector_store = None
             return None
     
-    def add_documents(self, file_paths: List[str]):
-        """Add new documents to the vector store"""
+    def add_documents(self, file_paths: List[str], content_hashes: Optional[List[str]] = None):
+        """Add new documents to the vector store
+        
+        content_hashes, when given, are the files' DocumentProcessor._file_hash digests, already
+        computed by the caller; otherwise each file is hashed here.
+        """
         try:
-            documents = self.processor.process_documents(file_paths)
+            if self.vector_store is None:
+                self.initialize_vector_store()
+                if self.vector_store is None:
+                    return 0
+            
+            # Loading/splitting runs in a producer thread while this thread embeds,
+            # with a bounded queue so parsed chunks cannot pile up ahead of the embedder
+            batches = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+            producer = threading.Thread(target=self._produce_batches, args=(file_paths, content_hashes, batches), daemon=True)
+            producer.start()
+            
+            texts = []
+            metadatas = []
+            embeddings = []
+            done = False
+            try:
+                while True:
+                    batch = batches.get()
+                    if batch is None:
+                        done = True
+                        break
+                    batch_texts = [doc.page_content for doc in batch]
+                    embeddings.extend(self.processor.embeddings.embed_documents(batch_texts))
+                    texts.extend(batch_texts)
+                    metadatas.extend(doc.metadata for doc in batch)
+            finally:
+                # Unblock the producer if embedding failed part way through
+                while not done:
+                    done = batches.get() is None
+            producer.join()
             
-            if not documents:
+            if not texts:
                 print("No documents processed")
                 return 0
-                
-            if self.vector_store is None:
-                self.initialize_vector_store(documents)
-            else:
-                self.vector_store.add_documents(documents)
-                self.vector_store.persist()
             
-            print(f"Added {len(documents)} document chunks to vector store")
-            return len(documents)
+            ids = [str(uuid.uuid4()) for _ in texts]
+            self._write_embeddings(ids, embeddings, metadatas, texts)
+            self.retrieval_cache.clear()
+            self.generation += 1
+            if self._count_cache is not None:
+                self._count_cache += len(ids)
+            
+            print(f"Added {len(ids)} document chunks to vector store")
+            return len(ids)
         except Exception as e:
-            print(f"Error adding documents: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error adding documents: %s", e)
             return 0
     
+    def _produce_batches(self, file_paths: List[str], content_hashes: Optional[List[str]], batches: queue.Queue):
+        """Load and split files into chunk batches; None marks the end"""
+        try:
+            for batch in self.processor.iter_chunk_batches(
+                file_paths, INGEST_BATCH_SIZE, is_ingested=self._is_ingested, content_hashes=content_hashes
+            ):
+                batches.put(batch)
+        except Exception as e:
+            logger.warning("Error processing documents: %s", e)
+        finally:
+            batches.put(None)
+    
+    def _is_ingested(self, content_hash: str) -> bool:
+        """Check the collection itself for chunks of a file, by the content_hash in their metadata"""
+        found = self.vector_store._collection.get(where={"content_hash": content_hash}, limit=1, include=[])
+        return bool(found["ids"])
+    
+    def _write_embeddings(self, ids: List[str], embeddings, metadatas, texts: List[str]):
+        """Write a whole ingest to the collection in as few (max-size) upserts as possible"""
+        collection = self.vector_store._collection
+        for batch_ids, batch_embeddings, batch_metadatas, batch_texts in create_batches(
+            api=self._get_client(),
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            documents=texts
+        ):
+            collection.upsert(
+                ids=batch_ids,
+                embeddings=batch_embeddings,
+                metadatas=batch_metadatas,
+                documents=batch_texts
+            )
+    
+    def get_retriever(self):
+        """Get a retriever over the live collection that uses the retrieval cache"""
+        return CachedRetriever(manager=self)
+    
+    def retrieve(self, query: str) -> List[Document]:
+        """Retrieve chunks for a query, reusing results when the same question was asked before
+        
+        Returns an empty list when no candidate clears RETRIEVAL_SCORE_THRESHOLD (or the
+        collection has none); RAGAssistant then answers without calling the LLM.
+        """
+        if self.vector_store is None:
+            return []
+        
+        documents = self.retrieval_cache.get(query)
+        if documents is None:
+            embedding = self.processor.embeddings.embed_query(query)
+            documents = self._search_by_vector(embedding)
+            self.retrieval_cache.put(query, documents)
+        return list(documents)
+    
+    def _search_by_vector(self, embedding) -> List[Document]:
+        """Fetch candidates, drop those below the optional score threshold, then pick k (MMR or top-k)"""
+        k = RETRIEVER_SEARCH_KWARGS.get("k", 4)
+        mmr = RETRIEVER_SEARCH_TYPE == "mmr"
+        results = self.vector_store._collection.query(
+            query_embeddings=[embedding],
+            n_results=RETRIEVER_SEARCH_KWARGS.get("fetch_k", 20) if mmr else k,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        candidates = np.asarray(results["embeddings"][0], dtype=np.float32)
+        if not len(candidates):
+            return []
+        
+        query = np.asarray(embedding, dtype=np.float32)
+        keep = np.arange(len(candidates))
+        if RETRIEVAL_SCORE_THRESHOLD is not None:
+            # Weak matches only pad the prompt, so they are dropped before selection
+            scores = candidates @ query / (np.linalg.norm(candidates, axis=1) * np.linalg.norm(query) + 1e-12)
+            keep = np.flatnonzero(scores >= RETRIEVAL_SCORE_THRESHOLD)
+        if mmr and len(keep):
+            selected = maximal_marginal_relevance(
+                query, candidates[keep], k=k, lambda_mult=RETRIEVER_SEARCH_KWARGS.get("lambda_mult", 0.5)
+            )
+            keep = keep[selected]
+        
+        texts = results["documents"][0]
+        metadatas = results["metadatas"][0]
+        return [Document(page_content=texts[i], metadata=metadatas[i] or {}) for i in keep[:k]]
+    
     def search_documents(self, query: str, k: int = 4):
         """Search for relevant documents"""
         if self.vector_store is None:
@@ -98,7 +220,7 @@ class VectorStoreManager:
         try:
             return self.vector_store.similarity_search(query, k=k)
         except Exception as e:
-            print(f"Error searching documents: {str(e)}")
+            logger.warning("Error searching documents: %s", e)
             return []
     
     def get_stats(self):
@@ -106,22 +228,30 @@ class VectorStoreManager:
         if self.vector_store is None:
             return {"collection_count": 0}
         
-        try:
-            collection = self.vector_store._client.get_collection(COLLECTION_NAME)
-            return {"collection_count": collection.count()}
-        except:
-            return {"collection_count": 0}
+        if self._count_cache is None:
+            try:
+                self._count_cache = self.vector_store._collection.count()
+            except:
+                return {"collection_count": 0}
+        return {"collection_count": self._count_cache}
     
     def clear_vector_store(self):
         """Clear the vector store"""
         try:
             if os.path.exists(VECTOR_STORE_PATH):
                 import shutil
+                if self._client is not None:
+                    # Release the cached SQLite handles before removing the files
+                    self._client.clear_system_cache()
+                    self._client = None
                 shutil.rmtree(VECTOR_STORE_PATH)
+                self.retrieval_cache.clear()
+                self.generation += 1
+                self._count_cache = 0
                 print("Vector store cleared")
                 self.vector_store = None
                 return True
         except Exception as e:
-            print(f"Error clearing vector store: {str(e)}")
+            logger.warning("Error clearing vector store: %s", e)
             return False
         return False
\ No newline at end of file